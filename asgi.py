@@ -0,0 +1,239 @@
+"""
+Asyncio (ASGI) serving mode for mainnap.
+
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:$PORT
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Same Flask app, same routes and JSON contracts, but the event loop owns the
+sockets: an idle keep-alive launcher or a slow client costs a coroutine, not
+a worker. Request bodies are read on the loop, the app itself (DB work) runs
+in a bounded thread pool, and file downloads (/api/updates/latest/download)
+are streamed from disk in chunks without holding an app thread. Panel live
+streams (/admin/api/events) are pulled on their own pool, never the app pool,
+and are closed as soon as the browser disconnects.
+"""
+
+import sys
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import mainnap
+
+ASGI_APP_THREADS = 16                     # concurrent requests inside Flask / DB
+ASGI_IO_THREADS = 4                       # disk reads for streamed downloads
+DOWNLOAD_CHUNK = 256 * 1024
+BODY_SPOOL_BYTES = 1024 * 1024            # bigger uploads spill to a temp file
+
+_app_pool = ThreadPoolExecutor(max_workers=ASGI_APP_THREADS, thread_name_prefix="asgi-app")
+_io_pool = ThreadPoolExecutor(max_workers=ASGI_IO_THREADS, thread_name_prefix="asgi-io")
+# one thread per live stream; subscribe_events() refuses more than EVENT_MAX_CLIENTS
+_stream_pool = ThreadPoolExecutor(max_workers=mainnap.EVENT_MAX_CLIENTS, thread_name_prefix="asgi-sse")
+
+
+class FileWrapper:
+    """
+    wsgi.file_wrapper: send_file() hands the open file back to us untouched,
+    so the loop can stream it instead of a worker thread iterating it.
+    """
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        while True:
+            chunk = self.filelike.read(self.block_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        close = getattr(self.filelike, "close", None)
+        if close:
+            close()
+
+
+def _environ(scope, body, body_len):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(body_len),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "wsgi.file_wrapper": FileWrapper,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+        key = "HTTP_" + name
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES)
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            return None, 0
+        chunk = message.get("body", b"")
+        if chunk:
+            body.write(chunk)
+            size += len(chunk)
+        if not message.get("more_body"):
+            break
+    body.seek(0)
+    return body, size
+
+
+def _call_flask(environ):
+    """
+    Runs in the app pool. Buffered responses (Content-Length set) are fully
+    read here; anything else comes back as an iterator for chunked pulling.
+    """
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+        return lambda data: None
+
+    it = mainnap.app(environ, start_response)
+    if isinstance(it, FileWrapper):
+        return started, it, None
+    has_length = any(k.lower() == "content-length" for k, _ in started.get("headers", []))
+    if has_length:
+        try:
+            return started, None, b"".join(it)
+        finally:
+            close = getattr(it, "close", None)
+            if close:
+                close()
+    return started, it, None
+
+
+def _next_chunk(it):
+    try:
+        return next(it)
+    except StopIteration:
+        return None
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _stream_events(loop, it, client, receive, send):
+    """
+    SSE body: the blocking queue wait runs on _stream_pool; a closed tab ends
+    the stream right away instead of at the next keepalive / EVENT_STREAM_MAX_SEC.
+    """
+    gone = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        while True:
+            pull = loop.run_in_executor(_stream_pool, _next_chunk, it)
+            done, _ = await asyncio.wait({pull, gone}, return_when=asyncio.FIRST_COMPLETED)
+            if pull not in done:
+                client.close()  # wakes q.get, the generator returns
+                await pull
+                return
+            chunk = pull.result()
+            if chunk is None:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        gone.cancel()
+
+
+async def _http(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    body, body_len = await _read_body(receive)
+    if body is None:
+        return
+    try:
+        environ = _environ(scope, body, body_len)
+        started, it, payload = await loop.run_in_executor(_app_pool, _call_flask, environ)
+    finally:
+        body.close()
+
+    await send({
+        "type": "http.response.start",
+        "status": started["status"],
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in started["headers"]],
+    })
+
+    if payload is not None:
+        await send({"type": "http.response.body", "body": payload})
+        return
+
+    try:
+        client = environ.get("mainnap.event_client")
+        if client is not None:
+            it = iter(it)
+            await _stream_events(loop, it, client, receive, send)
+        elif isinstance(it, FileWrapper):
+            while True:
+                chunk = await loop.run_in_executor(_io_pool, it.filelike.read, DOWNLOAD_CHUNK)
+                if not chunk:
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            it = iter(it)
+            while True:
+                chunk = await loop.run_in_executor(_app_pool, _next_chunk, it)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        if client is None:
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        close = getattr(it, "close", None)
+        if close:
+            await loop.run_in_executor(_io_pool, close)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            mainnap.start_background_jobs()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            _app_pool.shutdown(wait=False)
+            _io_pool.shutdown(wait=False)
+            _stream_pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http":
+        await _http(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        await _lifespan(receive, send)
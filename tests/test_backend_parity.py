@@ -0,0 +1,265 @@
+"""
+Same launcher-facing behaviour on both DB backends: check_key, heartbeat,
+update_keys (and when it revokes license tokens), key status counters, every
+launcher log filter and ?/% inside SQL literals. sqlite always; postgres when
+MAINNAP_TEST_PG_DSN points at a scratch database (the migrations create the
+tables, rows are namespaced per run).
+
+    python -m pytest -q tests
+    MAINNAP_TEST_PG_DSN=postgresql://postgres@/postgres?host=/tmp/pg python -m pytest -q tests
+"""
+
+import os
+import sys
+import uuid
+import tempfile
+
+import pytest
+
+# before the import: importing mainnap runs ensure_schema() on DATA_DIR
+DATA_DIR = tempfile.mkdtemp(prefix="mainnap-test-")
+os.environ["MAINNAP_DATA_DIR"] = DATA_DIR
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mainnap  # noqa: E402
+
+PG_DSN = os.environ.get("MAINNAP_TEST_PG_DSN", "")
+BACKENDS = ["sqlite"] + (["postgres"] if PG_DSN else [])
+
+
+@pytest.fixture(params=BACKENDS)
+def m(request):
+    mainnap.DB_BACKEND = request.param
+    mainnap.PG_DSN = PG_DSN
+    mainnap.use_data_dir(os.path.join(DATA_DIR, request.param))
+    mainnap.app.config["PROPAGATE_EXCEPTIONS"] = True
+    if mainnap.key_filter_on():
+        mainnap.rebuild_key_filter("test")
+    return mainnap
+
+
+@pytest.fixture
+def uid():
+    return uuid.uuid4().hex[:10].upper()
+
+
+def make_keys(m, uid, count):
+    client = m.app.test_client()
+    r = client.post("/api/ds/key/create", json={"count": count, "prefix": f"T{uid}-"},
+                    headers={"X-Admin-Pin": m.ADMIN_PIN})
+    assert r.status_code == 200
+    keys = r.get_json()["keys"]
+    assert len(keys) == count
+    conn = m.get_db()
+    cur = conn.cursor()
+    ids = {kv: m.db_fetchone(cur, "SELECT id FROM keys WHERE key_value=?", (kv,))["id"] for kv in keys}
+    conn.close()
+    return [(ids[kv], kv) for kv in keys]
+
+
+def check_key(client, key, hwid):
+    r = client.post("/api/check_key", json={"key": key, "hwid": hwid})
+    return r.status_code, r.get_json()
+
+
+def heartbeat(client, key, hwid):
+    return client.post("/api/heartbeat", json={"key": key, "hwid": hwid}).get_json()
+
+
+def edit(m, key_id, **fields):
+    conn = m.get_db()
+    cur = conn.cursor()
+    changed = m.update_keys(cur, [key_id], fields)
+    conn.commit()
+    conn.close()
+    return changed
+
+
+def test_check_key(m, uid):
+    (_, kv), = make_keys(m, uid, 1)
+    client = m.app.test_client()
+    assert check_key(client, "", "H1")[0] == 400
+    assert check_key(client, f"T{uid}-NOPE", "H1")[1]["reason"] == "not_found"
+
+    status, body = check_key(client, kv, "H1")
+    assert status == 200 and body["ok"] and body["first"]
+    status, body = check_key(client, kv, "H1")
+    assert body["ok"] and not body["first"]
+    assert check_key(client, kv, "H2")[1]["reason"] == "hwid_mismatch"
+
+
+def test_heartbeat(m, uid):
+    (_, kv), = make_keys(m, uid, 1)
+    client = m.app.test_client()
+    check_key(client, kv, "H1")
+    body = heartbeat(client, kv, "H1")
+    assert body["ok"] and body["next_heartbeat_sec"] > 0
+    assert heartbeat(client, kv, "H2")["reason"] == "hwid_mismatch"
+    assert heartbeat(client, f"T{uid}-NOPE", "H1")["reason"] == "not_found"
+
+
+def test_update_keys(m, uid):
+    (a_id, a), (b_id, b) = make_keys(m, uid, 2)
+    client = m.app.test_client()
+
+    assert edit(m, a_id, is_banned=1, ban_reason="test") == 1
+    assert check_key(client, a, "H1")[1]["reason"] == "banned"
+    assert heartbeat(client, a, "H1")["reason"] == "inactive"
+
+    assert edit(m, a_id, is_banned=0, key_value=f"T{uid}-RENAMED") == 1
+    assert check_key(client, a, "H1")[1]["reason"] == "not_found"
+    assert check_key(client, f"T{uid}-RENAMED", "H1")[1]["ok"]
+
+    assert edit(m, b_id, expires_at="2000-01-01 00:00:00") == 1
+    assert check_key(client, b, "H1")[1]["reason"] == "expired"
+    assert edit(m, b_id, is_active=0, expires_at="") == 1
+    assert check_key(client, b, "H1")[1]["reason"] == "inactive"
+
+
+def test_launcher_logs_filters(m, uid):
+    keys = [f"T{uid}-K{i}" for i in range(3)]
+    hwids = [f"T{uid}-H{i}" for i in range(2)]
+    events = [f"t{uid.lower()}_start", f"t{uid.lower()}_crash"]
+    rows = []
+    for i in range(36):
+        rows.append((events[i % 2], keys[i % 3], hwids[i % 2], "10.0.0.1", f"details {uid} {i}",
+                     "2026-01-%02d 12:00:00" % (1 + i % 28)))
+    conn = m.get_db()
+    cur = conn.cursor()
+    m.db_insert_many(cur, "launcher_events", m.LAUNCHER_EVENT_COLUMNS, rows)
+    conn.commit()
+    ours = m.db_fetchall(cur, "SELECT id, event, key_value, hwid, details, created_at FROM launcher_events WHERE details LIKE ?",
+                         (f"details {uid} %",))
+    assert len(ours) == len(rows)
+
+    cases = [
+        {"f_key": keys[0]},
+        {"f_hwid": hwids[1]},
+        {"f_event": events[0]},
+        {"f_key": keys[1], "f_event": events[1]},
+        {"f_key": keys[2], "f_hwid": hwids[0], "f_event": events[0]},
+        {"f_key": keys[0], "f_from": "2026-01-10 00:00:00"},
+        {"f_event": events[1], "f_from": "2026-01-05 00:00:00", "f_to": "2026-01-20 00:00:00"},
+        {"f_from": "2026-01-03 00:00:00", "f_to": "2026-01-04 23:59:59"},
+        {"f_hwid": hwids[0], "q": f"{uid} 1"},
+    ]
+    for f in cases:
+        sql, params = m.launcher_logs_sql(limit=100000, **f)
+        got = [r["id"] for r in m.db_fetchall(cur, sql, params)]
+        want = [
+            r["id"] for r in ours
+            if (not f.get("f_key") or r["key_value"] == f["f_key"])
+            and (not f.get("f_hwid") or r["hwid"] == f["f_hwid"])
+            and (not f.get("f_event") or r["event"] == f["f_event"])
+            and (not f.get("f_from") or r["created_at"] >= f["f_from"])
+            and (not f.get("f_to") or r["created_at"] <= f["f_to"])
+            and (not f.get("q") or f["q"] in r["details"])
+        ]
+        mine = {r["id"] for r in ours}
+        assert sorted((i for i in got if i in mine), reverse=True) == sorted(want, reverse=True), f
+        if f.get("f_from") and not (f.get("f_key") or f.get("f_hwid") or f.get("f_event")):
+            continue  # range only: newest created_at first, not id order
+        assert [i for i in got if i in mine] == sorted(want, reverse=True), f
+    conn.close()
+
+
+def test_literal_question_mark_and_percent(m, uid):
+    # ? and % inside quoted literals are text, not placeholders (postgres rewrite)
+    conn = m.get_db()
+    cur = conn.cursor()
+    m.db_insert_many(cur, "launcher_events", m.LAUNCHER_EVENT_COLUMNS, [
+        ("t_lit", f"T{uid}-K", "H", "10.0.0.1", f"why? 100% {uid}", "2026-01-01 12:00:00"),
+        ("t_lit", f"T{uid}-K", "H", "10.0.0.1", f"plain {uid}", "2026-01-01 12:00:00"),
+    ])
+    conn.commit()
+    row = m.db_fetchone(cur, "SELECT 'a?b' AS q, '50%' AS pct, ? AS p", ("x",))
+    assert (row["q"], row["pct"], row["p"]) == ("a?b", "50%", "x")
+    row = m.db_fetchone(cur, "SELECT COUNT(*) AS n FROM launcher_events WHERE details LIKE '%?%' AND details LIKE ?",
+                        (f"%{uid}",))
+    assert row["n"] == 1
+    row = m.db_fetchone(cur, "SELECT COUNT(*) AS n FROM launcher_events WHERE details LIKE '%100!%%' ESCAPE '!' AND event = 't_lit'")
+    assert row["n"] >= 1
+    conn.close()
+
+
+def db_epoch(m):
+    conn = m.get_db()
+    cur = conn.cursor()
+    epoch = int(m.db_fetchone(cur, "SELECT license_epoch FROM app_settings WHERE id=1")["license_epoch"])
+    conn.close()
+    return epoch
+
+
+def test_panel_save_revokes_only_on_change(m, uid):
+    (key_id, kv), = make_keys(m, uid, 1)
+    client = m.app.test_client()
+    with client.session_transaction() as s:
+        s["admin_authed"] = True
+    form = {"key_value": kv, "owner": "", "note": "", "ban_reason": "", "expires_at": "", "hwid": "",
+            "is_active": "1", "is_banned": "0"}
+
+    before = db_epoch(m)
+    assert client.post(f"/key/update/{key_id}", data={**form, "note": "only a note", "owner": "bob"}).status_code == 302
+    assert db_epoch(m) == before
+    assert client.post(f"/key/update/{key_id}", data={**form, "hwid": "H9"}).status_code == 302
+    assert db_epoch(m) == before + 1
+    assert edit(m, key_id, is_banned=0, is_active=1, hwid="H9") == 1
+    assert db_epoch(m) == before + 1
+    assert edit(m, key_id, is_banned=1) == 1
+    assert db_epoch(m) == before + 2
+
+
+def scan_counters(m, prefix):
+    conn = m.get_db()
+    cur = conn.cursor()
+    rows = m.db_fetchall(cur, "SELECT is_active, is_banned, expired, hwid, last_seen FROM keys WHERE key_value LIKE ?",
+                         (prefix + "%",))
+    conn.close()
+    return {
+        "name": prefix,
+        "total": len(rows),
+        "active": sum(1 for r in rows if r["is_active"] == 1 and r["is_banned"] == 0 and r["expired"] == 0),
+        "banned": sum(1 for r in rows if r["is_banned"] == 1),
+        "expired": sum(1 for r in rows if r["expired"] == 1),
+        "hwid_bound": sum(1 for r in rows if r["hwid"]),
+        "never_used": sum(1 for r in rows if not r["hwid"] and not r["last_seen"]),
+    }
+
+
+def assert_counters(m, prefix, **want):
+    got = next(r for r in m.key_counters("prefix") if r["name"] == prefix)
+    assert got == scan_counters(m, prefix)
+    assert {k: got[k] for k in want} == want
+    assert m.key_totals() == next(r for r in m.key_counters("all"))
+    assert m.check_key_counters() == []
+
+
+def test_key_counters(m, uid):
+    prefix = f"T{uid}-"
+    (k0, v0), (k1, _), (k2, _), (k3, _) = make_keys(m, uid, 4)
+    assert_counters(m, prefix, total=4, active=4, never_used=4, hwid_bound=0)
+
+    check_key(m.app.test_client(), v0, "H1")
+    assert_counters(m, prefix, hwid_bound=1, never_used=3)
+
+    assert edit(m, k1, is_banned=1, ban_reason="test") == 1
+    assert_counters(m, prefix, active=3, banned=1)
+
+    assert edit(m, k2, expires_at="2000-01-01 00:00:00") == 1
+    assert_counters(m, prefix, active=2, expired=1)
+
+    # time-driven: expires_ts passed, only the sweeper notices
+    conn = m.get_db()
+    cur = conn.cursor()
+    m.db_execute(cur, "UPDATE keys SET expires_at=?, expires_ts=? WHERE id=?", ("2000-01-01 00:00:00", 946677600, k3))
+    conn.commit()
+    conn.close()
+    assert m.expire_keys_sweep() >= 1
+    assert_counters(m, prefix, active=1, expired=2)
+
+    conn = m.get_db()
+    cur = conn.cursor()
+    assert m.delete_keys(cur, [k0, k2]) == 2
+    conn.commit()
+    conn.close()
+    assert_counters(m, prefix, total=2, active=0, banned=1, expired=1, hwid_bound=0, never_used=2)
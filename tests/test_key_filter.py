@@ -0,0 +1,86 @@
+"""
+check_key's key filter (sqlite only) against keys written behind the app's
+back: a raw INSERT (also paired with a DELETE, so the row count doesn't move),
+a raw rename, a suspected drift and an overdue check.
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402
+
+
+@pytest.fixture
+def m():
+    m = bench.load_app(tempfile.mkdtemp(prefix="mainnap-filter-test-"))
+    m.RATE_LIMIT_IP = (1e6, 1e6)
+    m.RATE_LIMIT_KEY = (1e6, 1e6)
+    r = m.app.test_client().post("/api/ds/key/create", json={"count": 3, "prefix": "KF-"},
+                                 headers={"X-Admin-Pin": m.ADMIN_PIN})
+    assert r.status_code == 200
+    m.rebuild_key_filter("test")
+    yield m
+    m.KEY_FILTER_TRUST_SEC = 60
+
+
+def raw_sql(m, sql, params=()):
+    # another tool on the same DB file: no key_filter_added() / removed()
+    conn = sqlite3.connect(m.DB_PATH)
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def reason(m, key):
+    return m.app.test_client().post("/api/check_key", json={"key": key, "hwid": "H1"}).get_json()["reason"]
+
+
+def test_filter_answers_misses(m):
+    assert m.key_filter_lookup("KF-NOPE") is False
+    assert reason(m, "KF-NOPE") == "not_found"
+    assert m.key_filter.stats()["trusted"]
+
+
+def test_raw_insert_with_delete_is_replayed(m):
+    victim = m.db_fetchone(m.get_db().cursor(), "SELECT key_value FROM keys ORDER BY id LIMIT 1")["key_value"]
+    raw_sql(m, "INSERT INTO keys (key_value, is_active, is_banned, created_at) VALUES ('KF-RAW', 1, 0, ?)",
+            (m.now_value(),))
+    raw_sql(m, "DELETE FROM keys WHERE key_value=?", (victim,))
+    built = m.key_filter.stats()["built_at"]
+
+    m.key_filter_maintain()
+    assert reason(m, "KF-RAW") == "ok"
+    s = m.key_filter.stats()
+    assert s["trusted"]
+    assert s["built_at"] == built  # replayed from key_filter_log, no rebuild
+
+
+def test_raw_rename_is_replayed(m):
+    raw_sql(m, "UPDATE keys SET key_value='KF-RENAMED' WHERE id=(SELECT MIN(id) FROM keys)")
+    m.key_filter_maintain()
+    assert reason(m, "KF-RENAMED") == "ok"
+    assert m.key_filter.stats()["trusted"]
+
+
+def test_suspected_drift_falls_through_to_db(m):
+    raw_sql(m, "INSERT INTO keys (key_value, is_active, is_banned, created_at) VALUES ('KF-LATE', 1, 0, ?)",
+            (m.now_value(),))
+    assert m.key_filter_lookup("KF-LATE") is False
+    m.key_filter.suspect()
+    assert m.key_filter_lookup("KF-LATE") is None
+    assert reason(m, "KF-LATE") == "ok"
+    m.rebuild_key_filter("test")
+    assert m.key_filter.stats()["trusted"]
+
+
+def test_overdue_check_falls_through_to_db(m):
+    m.KEY_FILTER_TRUST_SEC = 0
+    assert m.key_filter_lookup("KF-NOPE") is None
+    assert reason(m, "KF-NOPE") == "not_found"
+    assert not m.key_filter.stats()["trusted"]
@@ -0,0 +1,326 @@
+"""
+The paths that matter when the box is busy (sqlite): shed-level hysteresis
+and check_key answered from the valid-key cache, /api/launcher/log batches
+(gzip, 413, 400 on a malformed body), the expiry sweep's batches and its
+audit row, and the live panel stream (lag -> resync, disconnect -> the
+client slot is freed).
+
+    python -m pytest -q tests/test_load_paths.py
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import uuid
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402
+
+DATA_DIR = tempfile.mkdtemp(prefix="mainnap-load-test-")
+
+
+@pytest.fixture
+def m(monkeypatch):
+    m = bench.load_app(DATA_DIR)
+    monkeypatch.setattr(m, "RATE_LIMIT_IP", (1e6, 1e6))
+    monkeypatch.setattr(m, "RATE_LIMIT_KEY", (1e6, 1e6))
+    m._shed.update(level=0, decided=0.0, raised=0.0)
+    yield m
+    m._shed.update(level=0, decided=0.0, raised=0.0)
+
+
+@pytest.fixture
+def uid():
+    return uuid.uuid4().hex[:10].upper()
+
+
+def make_keys(m, uid, count):
+    r = m.app.test_client().post("/api/ds/key/create", json={"count": count, "prefix": f"L{uid}-"},
+                                 headers={"X-Admin-Pin": m.ADMIN_PIN})
+    assert r.status_code == 200
+    return r.get_json()["keys"]
+
+
+def pressure(m, monkeypatch, inflight=0.0, wait_ms=0.0):
+    # what db_pressure() would read from load_stats; decided on every call
+    monkeypatch.setattr(m, "db_pressure", lambda: (float(inflight), float(wait_ms)))
+    monkeypatch.setattr(m, "SHED_DECIDE_SEC", 0.0)
+
+
+def shed_count(m, work):
+    f = m.shed_counters.get(m.SHED_WORK[work])
+    return int(f[0]) if f else 0
+
+
+def query(m, sql, params=()):
+    conn = m.get_db()
+    rows = m.db_fetchall(conn.cursor(), sql, params)
+    conn.close()
+    return rows
+
+
+# ---- shedding ----
+
+def test_shed_level_hysteresis(m, monkeypatch):
+    pressure(m, monkeypatch, inflight=m.SHED_DB_INFLIGHT[1])
+    assert m.shed_level() == 2
+    # pressure gone: the raised level is held for SHED_HOLD_SEC
+    pressure(m, monkeypatch)
+    assert m.shed_level() == 2
+    pressure(m, monkeypatch, wait_ms=m.SHED_LOCK_WAIT_MS[0])
+    assert m.shed_level() == 2
+    m._shed["raised"] -= m.SHED_HOLD_SEC + 1
+    assert m.shed_level() == 1
+    # stepping down isn't a raise; level 1 pressure seen again re-arms the hold
+    assert m.shed_level() == 1
+    pressure(m, monkeypatch)
+    assert m.shed_level() == 1
+    m._shed["raised"] -= m.SHED_HOLD_SEC + 1
+    assert m.shed_level() == 0
+
+
+def test_shed_level_is_cached_between_decisions(m, monkeypatch):
+    pressure(m, monkeypatch, inflight=m.SHED_DB_INFLIGHT[0])
+    assert m.shed_level() == 1
+    monkeypatch.setattr(m, "SHED_DECIDE_SEC", 60.0)
+    monkeypatch.setattr(m, "db_pressure", lambda: pytest.fail("decided again inside SHED_DECIDE_SEC"))
+    assert m.shed_level() == 1
+
+
+def test_check_key_served_from_cache_under_load(m, monkeypatch, uid):
+    known, unseen = make_keys(m, uid, 2)
+    client = m.app.test_client()
+    assert client.post("/api/check_key", json={"key": known, "hwid": "H1"}).get_json()["ok"]
+
+    pressure(m, monkeypatch, inflight=m.SHED_DB_INFLIGHT[1])
+    cached = shed_count(m, "check_key_cached")
+    r = client.post("/api/check_key", json={"key": known, "hwid": "H1"})
+    body = r.get_json()
+    assert r.status_code == 200 and body["ok"] and not body["enter_logged"]
+    assert shed_count(m, "check_key_cached") == cached + 1
+
+    # never validated (or another hwid): level 2 answers only from the cache
+    for key, hwid in ((unseen, "H1"), (known, "H2")):
+        r = client.post("/api/check_key", json={"key": key, "hwid": hwid})
+        assert r.status_code == 503 and r.get_json()["reason"] == "overloaded"
+        assert r.headers["Retry-After"] == str(m.SHED_RETRY_AFTER_SEC)
+
+
+def test_cache_not_served_after_a_ban(m, monkeypatch, uid):
+    key, = make_keys(m, uid, 1)
+    client = m.app.test_client()
+    assert client.post("/api/check_key", json={"key": key, "hwid": "H1"}).get_json()["ok"]
+    conn = m.get_db()
+    cur = conn.cursor()
+    key_id = m.db_fetchone(cur, "SELECT id FROM keys WHERE key_value=?", (key,))["id"]
+    assert m.update_keys(cur, [key_id], {"is_banned": 1, "ban_reason": "test"}) == 1
+    conn.commit()
+    conn.close()
+
+    pressure(m, monkeypatch, inflight=m.SHED_DB_INFLIGHT[1])
+    assert m.cached_valid_key(key, "H1") is None
+    assert client.post("/api/check_key", json={"key": key, "hwid": "H1"}).status_code == 503
+
+
+def test_launcher_log_shed_at_level_one(m, monkeypatch):
+    pressure(m, monkeypatch, inflight=m.SHED_DB_INFLIGHT[0])
+    r = m.app.test_client().post("/api/launcher/log", json={"event": "crash"})
+    assert r.status_code == 503 and r.headers["Retry-After"]
+
+
+# ---- /api/launcher/log ----
+
+def launcher_rows(m, hwid):
+    return query(m, "SELECT event, key_value, hwid, details FROM launcher_events WHERE hwid=? ORDER BY id", (hwid,))
+
+
+def test_launcher_log_batch(m, uid):
+    hwid = f"H{uid}"
+    r = m.app.test_client().post("/api/launcher/log", json={
+        "key": "K-BATCH", "hwid": hwid,
+        "events": [
+            {"event": "crash", "details": "boom"},
+            {"event": "license_ok"},
+            {"event": "start", "key": "K-OTHER", "details": None},
+        ],
+    })
+    body = r.get_json()
+    assert r.status_code == 200 and body["ok"]
+    assert (body["accepted"], body["dropped"]) == (2, 1)
+    assert body["batch"] == m.launcher_log_contract()
+    assert [dict(row) for row in launcher_rows(m, hwid)] == [
+        {"event": "crash", "key_value": "K-BATCH", "hwid": hwid, "details": "boom"},
+        {"event": "start", "key_value": "K-OTHER", "hwid": hwid, "details": None},
+    ]
+
+
+def test_launcher_log_single_and_list(m, uid):
+    hwid = f"H{uid}"
+    client = m.app.test_client()
+    assert client.post("/api/launcher/log", json={"event": "crash", "hwid": hwid}).get_json()["accepted"] == 1
+    assert client.post("/api/launcher/log", json=[{"event": "a", "hwid": hwid}, {"event": "b", "hwid": hwid}]
+                       ).get_json()["accepted"] == 2
+    assert [r["event"] for r in launcher_rows(m, hwid)] == ["crash", "a", "b"]
+
+
+def test_launcher_log_gzip(m, uid):
+    hwid = f"H{uid}"
+    raw = gzip.compress(json.dumps({"hwid": hwid, "events": [{"event": "crash", "details": "x" * 5000}]}).encode())
+    r = m.app.test_client().post("/api/launcher/log", data=raw,
+                                 headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    assert r.status_code == 200 and r.get_json()["accepted"] == 1
+    assert launcher_rows(m, hwid)[0]["details"] == "x" * 5000
+
+
+def test_launcher_log_413(m, monkeypatch, uid):
+    client = m.app.test_client()
+    events = [{"event": "crash", "hwid": f"H{uid}"}] * (m.LAUNCHER_LOG_BATCH_MAX + 1)
+    r = client.post("/api/launcher/log", json={"events": events})
+    assert r.status_code == 413 and r.get_json()["reason"] == "too_many_events"
+    assert r.get_json()["batch"]["max_events"] == m.LAUNCHER_LOG_BATCH_MAX
+
+    # the limit is on the gunzipped size: a small, very compressible bomb
+    monkeypatch.setattr(m, "LAUNCHER_LOG_MAX_BODY", 4096)
+    raw = gzip.compress(json.dumps({"event": "crash", "hwid": f"H{uid}", "details": " " * 100000}).encode())
+    assert len(raw) < 4096
+    r = client.post("/api/launcher/log", data=raw,
+                    headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    assert r.status_code == 413 and r.get_json()["reason"] == "too_large"
+    assert launcher_rows(m, f"H{uid}") == []
+
+
+@pytest.mark.parametrize("body, reason", [
+    (b"{not json", "bad_json"),
+    (b"5", "bad_event"),
+    (b'"crash"', "bad_event"),
+    (b'{"events": "crash"}', "bad_event"),
+    (b'{"key": 5, "events": []}', "bad_event"),
+    (b'["crash"]', "bad_event"),
+    (b'[{"event": 5}]', "bad_event"),
+    (b'{"event": ["crash"]}', "bad_event"),
+    (b'[{"event": "ok", "hwid": "HBAD"}, {"event": "crash", "details": {"a": 1}}]', "bad_event"),
+])
+def test_launcher_log_400(m, body, reason):
+    r = m.app.test_client().post("/api/launcher/log", data=body, headers={"Content-Type": "application/json"})
+    assert r.status_code == 400 and r.get_json()["reason"] == reason
+    assert launcher_rows(m, "HBAD") == []  # nothing of a rejected batch goes in
+
+
+def test_launcher_log_bad_gzip(m):
+    r = m.app.test_client().post("/api/launcher/log", data=b"not gzip at all",
+                                 headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    assert r.status_code == 400 and r.get_json()["reason"] == "bad_gzip"
+
+
+# ---- expiry sweep ----
+
+def test_expiry_sweep_batches_and_audit_row(m, monkeypatch, uid):
+    keys = make_keys(m, uid, 12)
+    marks = ",".join("?" * len(keys))
+    conn = m.get_db()
+    cur = conn.cursor()
+    m.db_execute(cur, f"UPDATE keys SET expires_at=?, expires_ts=? WHERE key_value IN ({marks})",
+                 ("2000-01-01 00:00:00", 946677600, *keys))
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(m, "KEY_EXPIRY_BATCH", 5)
+    monkeypatch.setattr(m, "KEY_EXPIRY_BATCH_PAUSE_SEC", 0.0)
+    batches = []
+    fetchall = m.db_fetchall
+
+    def counting_fetchall(cur, sql, params=()):
+        rows = fetchall(cur, sql, params)
+        if sql == m.EXPIRY_DUE_SQL:
+            batches.append(len(rows))
+        return rows
+    monkeypatch.setattr(m, "db_fetchall", counting_fetchall)
+
+    last_log = query(m, "SELECT COALESCE(MAX(id), 0) AS id FROM admin_logs")[0]["id"]
+    assert m.expire_keys_sweep() == 12
+    assert batches == [5, 5, 2]
+    assert query(m, f"SELECT COUNT(*) AS n FROM keys WHERE expired=1 AND key_value IN ({marks})", keys)[0]["n"] == 12
+
+    logs = query(m, "SELECT actor, action, details FROM admin_logs WHERE id > ?", (last_log,))
+    assert [(r["actor"], r["action"]) for r in logs] == [("system", "expire_keys")]
+    assert logs[0]["details"].startswith("expired=12: ") and logs[0]["details"].endswith(" (+2)")
+    assert len(logs[0]["details"].split(": ", 1)[1].split(", ")) == 10
+
+    # nothing due: no batch beyond the first probe, no audit row
+    batches.clear()
+    assert m.expire_keys_sweep() == 0
+    assert batches == [0]
+    assert query(m, "SELECT COUNT(*) AS n FROM admin_logs WHERE id > ?", (last_log,))[0]["n"] == 1
+
+
+# ---- live panel stream ----
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_event_stream_lag_resyncs_and_unsubscribes(m, monkeypatch):
+    monkeypatch.setattr(m, "EVENT_CLIENT_BUFFER", 3)
+    c, backlog = m.subscribe_events()
+    assert c is not None and backlog == []
+    for i in range(10):
+        m.publish_event("test", {"i": i})
+    # the pump fills the bounded queue, then drops the slow reader
+    wait_for(lambda: c.lagged)
+    assert c.q.qsize() == 3
+    assert list(m.event_stream(c, backlog)) == [b"retry: 3000\n\n", b"event: resync\ndata: {}\n\n"]
+    assert c not in m._bus["clients"]
+
+
+def test_event_stream_replays_last_event_id(m):
+    head = m.publish_event("test", {"i": 1})
+    m.publish_event("test", {"i": 2})
+    wait_for(lambda: m._bus["seq"] >= head + 1 or not m._bus["pump"])
+    c, backlog = m.subscribe_events(head - 1)
+    m.unsubscribe_events(c)
+    assert backlog[:2] == [m.sse_frame(head, b'test\n{"i":1}'), m.sse_frame(head + 1, b'test\n{"i":2}')]
+
+    # a Last-Event-ID from another ring (ahead of ours, or overwritten): resync
+    c, backlog = m.subscribe_events(m.event_ring.head() + 100)
+    m.unsubscribe_events(c)
+    assert backlog == [b"event: resync\ndata: {}\n\n"]
+
+
+def test_event_stream_disconnect_frees_the_slot(m, monkeypatch):
+    before = set(m._bus["clients"])
+    monkeypatch.setattr(m, "EVENT_MAX_CLIENTS", len(before) + 1)
+    client = m.app.test_client()
+    with client.session_transaction() as s:
+        s["admin_authed"] = True
+
+    r = client.get("/admin/api/events", buffered=False)
+    assert r.status_code == 200 and r.mimetype == "text/event-stream"
+    stream = iter(r.response)
+    assert next(stream) == b"retry: 3000\n\n"
+    c, = m._bus["clients"] - before
+
+    full = client.get("/admin/api/events")
+    assert full.status_code == 503 and full.headers["Retry-After"] == "30"
+
+    # WSGI server closes the iterator when the browser goes away
+    r.close()
+    assert c not in m._bus["clients"]
+    r = client.get("/admin/api/events", buffered=False)
+    assert r.status_code == 200
+    c, = m._bus["clients"] - before
+
+    # asgi.py: http.disconnect -> close() wakes the blocked stream, which ends
+    stream = iter(r.response)
+    next(stream)
+    c.close()
+    assert list(stream) == []
+    assert c not in m._bus["clients"]
@@ -0,0 +1,69 @@
+"""
+Query plans of the hot statements (mainnap.hot_queries) on a CI-sized seeded
+sqlite DB: the expected index, no stray SCAN / temp B-tree, and a p99 inside
+bench.py's PLAN_BUDGETS_MS. The budgets are set for the full-size run
+(`python bench.py plans`, 100k keys / 1M rows over 30 days); rows per day
+here are about the same, so the LIMIT'ed log pages stop as early as there.
+A statement gets up to TIMINGS tries at its budget: a regressed plan misses
+every one, a scheduler hiccup doesn't.
+
+    python -m pytest -q tests/test_query_plans.py
+    MAINNAP_PLAN_BUDGET_SCALE=3 python -m pytest -q tests   # slow CI runner
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402
+
+KEYS = 5000
+ROWS = 50000
+DAYS = 2
+RUNS = 50
+TIMINGS = 3
+BUDGET_SCALE = float(os.environ.get("MAINNAP_PLAN_BUDGET_SCALE") or 1.0)
+
+
+@pytest.fixture(scope="module")
+def plans():
+    # load_app points the import at the scratch dir before ensure_schema() runs
+    data_dir = tempfile.mkdtemp(prefix="mainnap-plans-test-")
+    m = bench.load_app(data_dir)
+    keys = bench.seed_keys(m, KEYS, prefix="PL-")
+    bench.seed_plans_db(m, keys, ROWS, DAYS)
+    conn = m.get_db()
+    results = {r["name"]: r for r in m.check_query_plans(conn.cursor())}
+    yield m, conn, results
+    conn.close()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def test_every_hot_statement_has_a_budget(plans):
+    _, _, results = plans
+    assert sorted(set(results) - set(bench.PLAN_BUDGETS_MS)) == []
+
+
+@pytest.mark.parametrize("name", sorted(bench.PLAN_BUDGETS_MS))
+def test_plan(plans, name):
+    _, _, results = plans
+    r = results[name]
+    assert r["problems"] == [], f"{name} ({r['expect']}): {' | '.join(r['plan'])}"
+
+
+@pytest.mark.parametrize("name", sorted(bench.PLAN_BUDGETS_MS))
+def test_p99_within_budget(plans, name):
+    _, conn, results = plans
+    r = results[name]
+    budget = bench.PLAN_BUDGETS_MS[name] * BUDGET_SCALE
+    p99s = []
+    for _ in range(TIMINGS):
+        p99s.append(bench.time_statement(conn, r["sql"], r["params"], RUNS)["p99_ms"])
+        if p99s[-1] <= budget:
+            return
+    pytest.fail(f"{name}: p99 {p99s} ms > {budget:g} ms ({' | '.join(r['plan'])})")